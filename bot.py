@@ -1,6 +1,7 @@
 import logging
 import threading
 import time
+from typing import Optional
 from telegram import Update, ChatMemberAdministrator, ChatMemberOwner
 from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
 import schedule # Added import for scheduler
@@ -39,7 +40,9 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     formatted_stats = {
         'username': stats.get('username', 'Unknown'),
         'message_count': stats.get('total_messages', 0),
-        'last_message': stats.get('last_message', 'Never')
+        'last_message': stats.get('last_message', 'Never'),
+        'rank': stats.get('rank'),
+        'daily_rank': stats.get('daily_rank')
     }
     await update.message.reply_text(format_user_stats(formatted_stats))
 
@@ -175,7 +178,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # For private chats
     if chat.type == 'private':
         logger.info(f"Processing private message from allowed user {user.id}")
-        stats_handler.update_stats(user.id, user.username or user.first_name)
+        stats_handler.update_stats(user.id, user.username, user.first_name)
         return
 
     # For groups/supergroups
@@ -187,7 +190,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             if isinstance(bot_member, (ChatMemberAdministrator, ChatMemberOwner)):
                 logger.info(f"Processing message from allowed user {user.id} in group {chat.id}")
-                stats_handler.update_stats(user.id, user.username or user.first_name)
+                stats_handler.update_stats(user.id, user.username, user.first_name)
                 logger.info(f"Successfully updated stats for user {user.id}")
             else:
                 logger.warning(f"Bot is not admin in group {chat.id}")
@@ -195,20 +198,29 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Error checking bot status in group: {e}")
 
+def build_application(token: str = BOT_TOKEN, base_url: Optional[str] = None) -> Application:
+    """Create the application with all handlers registered"""
+    builder = Application.builder().token(token)
+    # base_url lets the load test point the bot at a local Bot API stand-in
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+
+    # Add handlers
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("topusers", topusers_command))
+    application.add_handler(CommandHandler("staff_stats", staff_stats_command))
+    application.add_handler(CommandHandler("staff_all", staff_all_command))
+    application.add_handler(CommandHandler("staff_off", staff_off_command))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
 def main():
     """Start the bot"""
     try:
         # Create application
-        application = Application.builder().token(BOT_TOKEN).build()
-
-        # Add handlers
-        application.add_handler(CommandHandler("start", start_command))
-        application.add_handler(CommandHandler("stats", stats_command))
-        application.add_handler(CommandHandler("topusers", topusers_command))
-        application.add_handler(CommandHandler("staff_stats", staff_stats_command))
-        application.add_handler(CommandHandler("staff_all", staff_all_command))
-        application.add_handler(CommandHandler("staff_off", staff_off_command))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        application = build_application()
 
         # Start scheduler in a separate thread
         def run_scheduler():
@@ -1,18 +1,32 @@
 import sqlite3
 import logging
+import threading
 from typing import Dict, Optional, List, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime
 from config import TIMEZONE_OFFSET
+from rank_index import RankIndex
 
 class Database:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, track_activity: bool = False):
         self.db_path = db_path
+        self.track_activity = track_activity
+        self.rank_index = RankIndex()
+        # Serializes counter writes with their rank index update, since the
+        # daily reset runs on the scheduler thread
+        self._write_lock = threading.Lock()
+        # Last known (username, first_name) per user, to skip no-op profile writes
+        self._profiles: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
         self.init_database()
 
     def get_current_time(self) -> str:
         """Get current time in UTC+3"""
         return (datetime.utcnow() + TIMEZONE_OFFSET).strftime('%Y-%m-%d %H:%M:%S')
 
+    def get_current_hour(self) -> int:
+        """Get current hour in UTC+3 as a number of hours since the epoch"""
+        now = datetime.utcnow() + TIMEZONE_OFFSET
+        return int((now - datetime(1970, 1, 1)).total_seconds()) // 3600
+
     def init_database(self):
         try:
             with sqlite3.connect(self.db_path) as conn:
@@ -22,31 +36,72 @@ class Database:
                 cursor.execute("""
                     CREATE TABLE user_stats (
                         user_id INTEGER PRIMARY KEY,
-                        username TEXT,
                         message_count INTEGER DEFAULT 0,
                         last_message_time TIMESTAMP,
                         is_banned BOOLEAN DEFAULT 0
                     )
                 """)
+                # Profile data lives apart from the counters and changes rarely
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS user_profiles (
+                        user_id INTEGER PRIMARY KEY,
+                        username TEXT,
+                        first_name TEXT
+                    )
+                """)
+                if self.track_activity:
+                    # Hourly rollup for timelines and heatmaps, kept across restarts
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS activity_hourly (
+                            user_id INTEGER,
+                            hour INTEGER,
+                            message_count INTEGER DEFAULT 0,
+                            PRIMARY KEY (user_id, hour)
+                        )
+                    """)
                 conn.commit()
+                cursor.execute("SELECT user_id, message_count, is_banned FROM user_stats")
+                self.rank_index.load(cursor.fetchall())
+                cursor.execute("SELECT user_id, username, first_name FROM user_profiles")
+                self._profiles = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
         except sqlite3.Error as e:
             logging.error(f"Database initialization error: {e}")
 
-    def update_user_stats(self, user_id: int, username: str):
+    def update_user_stats(self, user_id: int, username: Optional[str], first_name: Optional[str] = None):
         try:
             current_time = self.get_current_time()
-            with sqlite3.connect(self.db_path) as conn:
+            profile = (username, first_name)
+            with self._write_lock, sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                # Only counter columns are written per message
                 cursor.execute("""
-                    INSERT INTO user_stats (user_id, username, message_count, last_message_time, is_banned)
-                    VALUES (?, ?, 1, ?, 0)
+                    INSERT INTO user_stats (user_id, message_count, last_message_time, is_banned)
+                    VALUES (?, 1, ?, 0)
                     ON CONFLICT(user_id) DO UPDATE SET
                         message_count = message_count + 1,
-                        last_message_time = ?,
-                        username = ?
+                        last_message_time = ?
                         WHERE is_banned = 0
-                """, (user_id, username, current_time, current_time, username))
+                """, (user_id, current_time, current_time))
+                if self._profiles.get(user_id) != profile:
+                    cursor.execute("""
+                        INSERT INTO user_profiles (user_id, username, first_name)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            username = excluded.username,
+                            first_name = excluded.first_name
+                    """, (user_id, username, first_name))
+                if self.track_activity:
+                    cursor.execute("""
+                        INSERT INTO activity_hourly (user_id, hour, message_count)
+                        SELECT ?, ?, 1
+                        FROM user_stats
+                        WHERE user_id = ? AND is_banned = 0
+                        ON CONFLICT(user_id, hour) DO UPDATE SET
+                            message_count = message_count + 1
+                    """, (user_id, self.get_current_hour(), user_id))
                 conn.commit()
+                self._profiles[user_id] = profile
+                self.rank_index.increment(user_id)
         except sqlite3.Error as e:
             logging.error(f"Error updating user stats: {e}")
 
@@ -55,9 +110,10 @@ class Database:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                    SELECT username, message_count, last_message_time, is_banned
-                    FROM user_stats
-                    WHERE user_id = ?
+                    SELECT COALESCE(p.username, p.first_name), s.message_count, s.last_message_time, s.is_banned
+                    FROM user_stats s
+                    LEFT JOIN user_profiles p ON p.user_id = s.user_id
+                    WHERE s.user_id = ?
                 """, (user_id,))
                 result = cursor.fetchone()
                 if result:
@@ -72,16 +128,29 @@ class Database:
             logging.error(f"Error getting user stats: {e}")
             return None
 
+    def get_user_rank(self, user_id: int) -> Optional[Dict]:
+        """Get user's place by message count, served from the rank index"""
+        result = self.rank_index.rank(user_id)
+        if result is None:
+            return None
+        rank, total = result
+        return {
+            "rank": rank,
+            "total": total,
+            "percentile": round(rank / total * 100, 1)
+        }
+
     def get_top_users(self, limit: int = 10) -> List[Tuple[str, int]]:
         """Get top users by message count, excluding banned users"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                    SELECT username, message_count
-                    FROM user_stats
-                    WHERE is_banned = 0
-                    ORDER BY message_count DESC
+                    SELECT COALESCE(p.username, p.first_name), s.message_count
+                    FROM user_stats s
+                    LEFT JOIN user_profiles p ON p.user_id = s.user_id
+                    WHERE s.is_banned = 0
+                    ORDER BY s.message_count DESC
                     LIMIT ?
                 """, (limit,))
                 return cursor.fetchall()
@@ -89,35 +158,54 @@ class Database:
             logging.error(f"Error getting top users: {e}")
             return []
 
-    def get_activity_timeline(self, days: int = 7) -> List[Tuple[str, int, str]]:
-        """Get activity timeline for the specified period, excluding banned users"""
+    def get_activity_timeline(self, days: int = 7) -> List[Tuple[int, int, int]]:
+        """Get hourly activity rollup (user_id, count, epoch hour) for the specified period,
+        excluding banned users"""
+        if not self.track_activity:
+            return []
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                # Get dates for the specified period
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=days)
+                # First hour of the specified period
+                start_hour = self.get_current_hour() - days * 24
 
                 cursor.execute("""
-                    SELECT username, COUNT(*) as msg_count, date(last_message_time) as msg_date
-                    FROM user_stats
-                    WHERE last_message_time >= ?
-                    AND is_banned = 0
-                    GROUP BY date(last_message_time)
-                    ORDER BY msg_date DESC
-                """, (start_date.strftime('%Y-%m-%d'),))
+                    SELECT a.user_id, a.message_count, a.hour
+                    FROM activity_hourly a
+                    LEFT JOIN user_stats u ON u.user_id = a.user_id
+                    WHERE a.hour >= ?
+                    AND COALESCE(u.is_banned, 0) = 0
+                """, (start_hour,))
                 return cursor.fetchall()
         except sqlite3.Error as e:
             logging.error(f"Error getting activity timeline: {e}")
             return []
 
+    def get_display_names(self, user_ids: List[int]) -> Dict[int, str]:
+        """Get display names (username, else first name) for the given users"""
+        if not user_ids:
+            return {}
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                placeholders = ", ".join("?" * len(user_ids))
+                cursor.execute(f"""
+                    SELECT user_id, COALESCE(username, first_name)
+                    FROM user_profiles
+                    WHERE user_id IN ({placeholders})
+                """, list(user_ids))
+                return dict(cursor.fetchall())
+        except sqlite3.Error as e:
+            logging.error(f"Error getting display names: {e}")
+            return {}
+
     def ban_user(self, user_id: int, ban: bool = True):
         """Ban or unban a user. When a user is banned:
         1. Their messages won't be counted in statistics
         2. They won't appear in top users list
         3. Their existing messages remain in the database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_lock, sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE user_stats
@@ -125,6 +213,7 @@ class Database:
                     WHERE user_id = ?
                 """, (1 if ban else 0, user_id))
                 conn.commit()
+                self.rank_index.set_banned(user_id, ban)
                 logging.info(f"User {user_id} {'banned' if ban else 'unbanned'} successfully")
         except sqlite3.Error as e:
             logging.error(f"Error {'banning' if ban else 'unbanning'} user: {e}")
@@ -132,7 +221,7 @@ class Database:
     def reset_stats(self):
         """Reset all statistics while preserving ban status"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_lock, sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 # Обнуляем счетчик сообщений и время последнего сообщения
                 cursor.execute("""
@@ -143,6 +232,7 @@ class Database:
                 """)
                 affected_rows = cursor.rowcount
                 conn.commit()
+                self.rank_index.reset()
                 logging.info(f"Successfully reset stats for {affected_rows} users")
                 return True
         except sqlite3.Error as e:
@@ -155,9 +245,10 @@ class Database:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                    SELECT user_id, username, message_count, last_message_time, is_banned
-                    FROM user_stats
-                    ORDER BY message_count DESC
+                    SELECT s.user_id, COALESCE(p.username, p.first_name), s.message_count, s.last_message_time, s.is_banned
+                    FROM user_stats s
+                    LEFT JOIN user_profiles p ON p.user_id = s.user_id
+                    ORDER BY s.message_count DESC
                 """)
                 rows = cursor.fetchall()
 
@@ -182,10 +273,11 @@ class Database:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                    SELECT user_id, username
-                    FROM user_stats
-                    WHERE is_banned = 0
-                    ORDER BY message_count DESC
+                    SELECT s.user_id, COALESCE(p.username, p.first_name)
+                    FROM user_stats s
+                    LEFT JOIN user_profiles p ON p.user_id = s.user_id
+                    WHERE s.is_banned = 0
+                    ORDER BY s.message_count DESC
                 """)
                 return cursor.fetchall()
         except sqlite3.Error as e:
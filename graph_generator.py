@@ -1,7 +1,19 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import io
-from typing import List, Tuple
-from datetime import datetime, timedelta
+import itertools
+from typing import Callable, Dict, List, Tuple, Optional
+from datetime import datetime
+from config import TIMEZONE_OFFSET
+
+# Bin unit and step (in that unit) for each timeline resolution
+RESOLUTIONS = {
+    "hour": ("h", 1),
+    "day": ("D", 1),
+    "week": ("D", 7),
+}
+
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
 
 class GraphGenerator:
     @staticmethod
@@ -33,34 +45,115 @@ class GraphGenerator:
         return buf.getvalue()
 
     @staticmethod
-    def generate_timeline_graph(data: List[Tuple[str, int, str]], period_days: int = 7) -> bytes:
-        """Generate a line graph showing activity over time"""
-        plt.figure(figsize=(10, 6))
-        plt.clf()
+    def _floor(times: np.ndarray, resolution: str) -> np.ndarray:
+        """Floor datetime64 values to the start of their bin"""
+        unit, _ = RESOLUTIONS[resolution]
+        floored = times.astype(f'datetime64[{unit}]')
+        if resolution == "week":
+            # Epoch day 0 is a Thursday; shift bins to start on Monday
+            days = floored.astype(np.int64)
+            floored = floored - ((days + 3) % 7).astype('timedelta64[D]')
+        return floored
+
+    @staticmethod
+    def _rollup_arrays(data: List[Tuple[int, int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Split (user_id, count, epoch hour) rows into user id, count and datetime64[h] arrays"""
+        columns = np.fromiter(
+            itertools.chain.from_iterable(data),
+            dtype=np.int64,
+            count=3 * len(data)
+        ).reshape(-1, 3)
+        return columns[:, 0], columns[:, 1], columns[:, 2].view('datetime64[h]')
+
+    @staticmethod
+    def bin_timeline(data: List[Tuple[int, int, int]], period_days: int = 7,
+                     resolution: str = "day", top_n: int = 0,
+                     end: Optional[datetime] = None) -> Tuple[np.ndarray, List[int], np.ndarray]:
+        """Aggregate hourly rollup rows into time bins.
+
+        Returns (bins, series user ids, counts matrix of shape series x bins).
+        With top_n > 0 there is one series per most active user, otherwise
+        a single series for everyone and the user id list is empty.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        unit, step = RESOLUTIONS[resolution]
+
+        end = end or datetime.utcnow() + TIMEZONE_OFFSET
+        end_hour = np.datetime64(end, 'h')
+        start_hour = end_hour - np.timedelta64(period_days * 24, 'h')
+        first_bin = GraphGenerator._floor(np.array([start_hour]), resolution)[0]
+        last_bin = GraphGenerator._floor(np.array([end_hour]), resolution)[0]
+        bins = np.arange(first_bin, last_bin + np.timedelta64(step, unit), np.timedelta64(step, unit))
+
+        user_ids, counts, hours = GraphGenerator._rollup_arrays(data)
+        bin_idx = (GraphGenerator._floor(hours, resolution) - first_bin).astype(np.int64) // step
+        mask = (hours >= start_hour) & (bin_idx >= 0) & (bin_idx < len(bins))
+        user_ids, counts, bin_idx = user_ids[mask], counts[mask], bin_idx[mask]
+
+        if top_n > 0 and len(user_ids):
+            users, user_idx = np.unique(user_ids, return_inverse=True)
+            totals = np.bincount(user_idx, weights=counts, minlength=len(users))
+            top = np.argsort(-totals, kind='stable')[:top_n]
+            series_of_user = np.full(len(users), -1, dtype=np.int64)
+            series_of_user[top] = np.arange(len(top))
+            series_idx = series_of_user[user_idx]
+            keep = series_idx >= 0
+            series_idx, counts, bin_idx = series_idx[keep], counts[keep], bin_idx[keep]
+            series_users = [int(user_id) for user_id in users[top]]
+        else:
+            series_idx = np.zeros(len(counts), dtype=np.int64)
+            series_users = []
+
+        n_series = max(len(series_users), 1)
+        matrix = np.bincount(
+            series_idx * len(bins) + bin_idx,
+            weights=counts,
+            minlength=n_series * len(bins)
+        ).reshape(n_series, len(bins)).astype(np.int64)
+        return bins, series_users, matrix
 
-        # Create timeline data
-        timeline = {}
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=period_days)
+    @staticmethod
+    def activity_heatmap(data: List[Tuple[int, int, int]]) -> np.ndarray:
+        """Aggregate hourly rollup rows into a weekday x hour-of-day matrix (7 x 24)"""
+        _, counts, hours = GraphGenerator._rollup_arrays(data)
+        hour_numbers = hours.astype(np.int64)
+        hour_of_day = hour_numbers % 24
+        # Epoch day 0 is a Thursday, so Monday == 0 after the shift
+        weekday = (hour_numbers // 24 + 3) % 7
+        return np.bincount(
+            weekday * 24 + hour_of_day,
+            weights=counts,
+            minlength=7 * 24
+        ).reshape(7, 24).astype(np.int64)
+
+    @staticmethod
+    def generate_timeline_graph(data: List[Tuple[int, int, int]], period_days: int = 7,
+                                resolution: str = "day", top_n: int = 0,
+                                get_names: Optional[Callable[[List[int]], Dict[int, str]]] = None) -> bytes:
+        """Generate a line graph showing activity over time.
 
-        # Initialize timeline with zeros
-        current_date = start_date
-        while current_date <= end_date:
-            timeline[current_date.strftime('%Y-%m-%d')] = 0
-            current_date += timedelta(days=1)
+        get_names resolves display names for the user ids of the top_n series.
+        """
+        plt.figure(figsize=(10, 6))
+        plt.clf()
 
-        # Fill in actual data
-        for _, count, date_str in data:
-            if date_str in timeline:
-                timeline[date_str] = count
+        bins, user_ids, matrix = GraphGenerator.bin_timeline(data, period_days, resolution, top_n)
+        if user_ids:
+            names = get_names(user_ids) if get_names else {}
+            labels = [names.get(user_id) or str(user_id) for user_id in user_ids]
+        else:
+            labels = ["Все пользователи"]
 
-        dates = list(timeline.keys())
-        counts = list(timeline.values())
+        marker = 'o' if len(bins) <= 60 else None
+        for label, counts in zip(labels, matrix):
+            plt.plot(bins, counts, marker=marker, label=label)
 
-        plt.plot(dates, counts, marker='o')
         plt.title("Активность за период")
         plt.xlabel("Дата")
         plt.ylabel("Количество сообщений")
+        if len(labels) > 1:
+            plt.legend(fontsize='small', ncol=2)
 
         # Rotate date labels
         plt.xticks(rotation=45, ha='right')
@@ -74,4 +167,31 @@ class GraphGenerator:
         buf.seek(0)
         plt.close()
 
-        return buf.getvalue()
\ No newline at end of file
+        return buf.getvalue()
+
+    @staticmethod
+    def generate_heatmap_graph(data: List[Tuple[int, int, int]], title: str = "Активность по часам") -> bytes:
+        """Generate an hour-of-day x weekday activity heatmap"""
+        plt.figure(figsize=(12, 5))
+        plt.clf()
+
+        matrix = GraphGenerator.activity_heatmap(data)
+
+        plt.imshow(matrix, aspect='auto', cmap='YlOrRd')
+        plt.colorbar(label="Количество сообщений")
+        plt.title(title)
+        plt.xlabel("Час")
+        plt.ylabel("День недели")
+        plt.xticks(range(24))
+        plt.yticks(range(7), WEEKDAYS)
+
+        # Adjust layout
+        plt.tight_layout()
+
+        # Save plot to bytes buffer
+        buf = io.BytesIO()
+        plt.savefig(buf, format='png')
+        buf.seek(0)
+        plt.close()
+
+        return buf.getvalue()
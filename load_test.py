@@ -0,0 +1,512 @@
+"""End-to-end load test for the bot against a local fake Telegram Bot API.
+
+Starts an HTTP stand-in for the Bot API (getUpdates, getChatMember,
+sendMessage, ...), runs the application from bot.py against it, replays
+multi-chat traffic and reports throughput, reply latency, dropped
+updates and resource usage.
+
+Usage:
+    python load_test.py --duration 30 --rate 50 --chats 5 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from config import ALLOWED_USERS, MAIN_DB_PATH
+
+BOT_ID = 1000000001
+LOAD_TEST_TOKEN = f"{BOT_ID}:LOADTEST"
+FLOOD_METHODS = ("getChatMember", "sendMessage")
+
+
+class FakeBotAPI:
+    """Minimal in-process stand-in for the Telegram Bot API"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 chat_send_limit: float = 0.0, retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chat_send_limit = chat_send_limit
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+
+        self._lock = threading.Condition()
+        self._updates: List[Dict] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._last_send: Dict[int, float] = {}
+
+        # Metrics
+        self.injected_at: Dict[int, float] = {}
+        self.fetched_at: Dict[int, float] = {}
+        self.commands: Dict[Tuple[int, int], float] = {}
+        self.reply_latencies: List[float] = []
+        self.calls: Dict[str, int] = {}
+        self.last_call = time.perf_counter()
+        self.flood_errors: Dict[str, int] = {}
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def inject_message(self, chat_id: int, chat_type: str, user_id: int, text: str) -> int:
+        """Queue an incoming message update and return its update_id"""
+        with self._lock:
+            update_id = self._next_update_id
+            message_id = self._next_message_id
+            self._next_update_id += 1
+            self._next_message_id += 1
+            message = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": chat_type},
+                "from": {"id": user_id, "is_bot": False,
+                         "first_name": f"User{user_id}", "username": f"user{user_id}"},
+                "text": text,
+            }
+            if chat_type != "private":
+                message["chat"]["title"] = f"Chat {chat_id}"
+            if text.startswith("/"):
+                command = text.split()[0]
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+            self._updates.append({"update_id": update_id, "message": message})
+            now = time.perf_counter()
+            self.injected_at[update_id] = now
+            if text.startswith("/"):
+                self.commands[(chat_id, message_id)] = now
+            self._lock.notify_all()
+            return update_id
+
+    def pending_updates(self) -> int:
+        with self._lock:
+            return len(self._updates)
+
+    def pending_replies(self) -> int:
+        with self._lock:
+            return len(self.commands)
+
+    def idle_for(self) -> float:
+        """Seconds since the bot last made a call other than getUpdates"""
+        with self._lock:
+            return time.perf_counter() - self.last_call
+
+    def _delay(self):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _flooded(self, method: str, params: Dict) -> bool:
+        """Decide whether to answer a call with 429 Too Many Requests"""
+        if method not in FLOOD_METHODS:
+            return False
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                return True
+            if method == "sendMessage" and self.chat_send_limit:
+                chat_id = int(params.get("chat_id", 0))
+                now = time.perf_counter()
+                last = self._last_send.get(chat_id)
+                if last is not None and now - last < 1 / self.chat_send_limit:
+                    return True
+                self._last_send[chat_id] = now
+        return False
+
+    def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            # Updates below the offset are confirmed by the client
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._lock.wait(remaining)
+            batch = self._updates[:limit]
+            now = time.perf_counter()
+            for update in batch:
+                self.fetched_at.setdefault(update["update_id"], now)
+            return batch
+
+    def _send_message(self, params: Dict) -> Dict:
+        chat_id = int(params["chat_id"])
+        reply_to = params.get("reply_to_message_id")
+        reply_parameters = params.get("reply_parameters")
+        if isinstance(reply_parameters, dict):
+            reply_to = reply_parameters.get("message_id")
+        with self._lock:
+            key = (chat_id, int(reply_to)) if reply_to else None
+            if key not in self.commands:
+                # Private chat replies are not quoted; match the oldest pending command
+                key = min((k for k in self.commands if k[0] == chat_id), default=None)
+            sent_at = self.commands.pop(key, None) if key else None
+            if sent_at is not None:
+                self.reply_latencies.append(time.perf_counter() - sent_at)
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "LoadTest", "username": "load_test_bot"},
+            "text": str(params.get("text", "")),
+        }
+
+    def _chat_member(self, params: Dict) -> Dict:
+        user_id = int(params["user_id"])
+        return {
+            "status": "administrator",
+            "user": {"id": user_id, "is_bot": user_id == BOT_ID, "first_name": f"User{user_id}"},
+            "can_be_edited": False,
+            "is_anonymous": False,
+            "can_manage_chat": True,
+            "can_delete_messages": True,
+            "can_manage_video_chats": True,
+            "can_restrict_members": True,
+            "can_promote_members": False,
+            "can_change_info": True,
+            "can_invite_users": True,
+            "can_post_stories": False,
+            "can_edit_stories": False,
+            "can_delete_stories": False,
+        }
+
+    def handle(self, method: str, params: Dict) -> Tuple[int, Dict]:
+        """Dispatch a Bot API call and return (HTTP status, JSON body)"""
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if method != "getUpdates":
+                self.last_call = time.perf_counter()
+        if method != "getUpdates":
+            self._delay()
+        if self._flooded(method, params):
+            with self._lock:
+                self.flood_errors[method] = self.flood_errors.get(method, 0) + 1
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+
+        if method == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "LoadTest",
+                      "username": "load_test_bot", "can_join_groups": True,
+                      "can_read_all_group_messages": True, "supports_inline_queries": False}
+        elif method == "getUpdates":
+            result = self._get_updates(params)
+            self._delay()
+        elif method == "getChatMember":
+            result = self._chat_member(params)
+        elif method == "sendMessage":
+            result = self._send_message(params)
+        else:
+            result = True
+        return 200, {"ok": True, "result": result}
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode("utf-8") if length else ""
+                status, body = api.handle(method, _parse_params(raw, self.headers.get("Content-Type", "")))
+                payload = json.dumps(body).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Long polls are cut off when the updater stops
+                    pass
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _parse_params(raw: str, content_type: str) -> Dict:
+    """Decode Bot API parameters sent either as JSON or as form fields"""
+    if not raw:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(raw)
+    params = {}
+    for key, values in parse_qs(raw).items():
+        value = values[-1]
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def build_script(duration: float, rate: float, chats: int, users: int,
+                 command_ratio: float, private_ratio: float, seed: int) -> List[Dict]:
+    """Generate a traffic script: Poisson arrivals spread over group and private chats"""
+    rng = random.Random(seed)
+    # Mix allowed users with outsiders whose messages the bot ignores
+    user_ids = list(ALLOWED_USERS[:users])
+    user_ids += [900000000 + i for i in range(max(0, users - len(user_ids)))]
+    chat_ids = [-1001000000000 - i for i in range(chats)]
+    commands = ["/stats", "/topusers", "/start"]
+
+    script = []
+    at = rng.expovariate(rate)
+    while at < duration:
+        user_id = rng.choice(user_ids)
+        if rng.random() < private_ratio:
+            chat_id, chat_type = user_id, "private"
+        else:
+            chat_id, chat_type = rng.choice(chat_ids), "supergroup"
+        text = rng.choice(commands) if rng.random() < command_ratio else f"message {len(script)}"
+        script.append({"at": round(at, 6), "chat_id": chat_id, "chat_type": chat_type,
+                       "user_id": user_id, "text": text})
+        at += rng.expovariate(rate)
+    return script
+
+
+def load_script(path: str) -> List[Dict]:
+    """Load a traffic script from a JSON list or JSON-lines file"""
+    with open(path, encoding="utf-8") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        script = json.loads(content)
+    else:
+        script = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return sorted(script, key=lambda item: item["at"])
+
+
+def replay(api: FakeBotAPI, script: List[Dict], started: float):
+    """Feed scripted updates to the fake API at their scheduled offsets"""
+    for item in script:
+        delay = started + item["at"] - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        api.inject_message(item["chat_id"], item["chat_type"], item["user_id"], item["text"])
+
+
+def _counted_messages(db_path: str) -> int:
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute("SELECT COALESCE(SUM(message_count), 0) FROM user_stats").fetchone()
+        return row[0]
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class HandlerTimer:
+    """Records when the bot's handlers start and finish each update.
+
+    The hooks run in handler groups before and after the bot's own group 0,
+    so the span between them covers the bot's handling of the update.
+    """
+
+    def __init__(self):
+        self.started_at: Dict[int, float] = {}
+        self.handling_times: List[float] = []
+        self.completed_at: List[float] = []
+
+    async def on_start(self, update, context):
+        self.started_at[update.update_id] = time.perf_counter()
+
+    async def on_complete(self, update, context):
+        now = time.perf_counter()
+        started = self.started_at.pop(update.update_id, None)
+        if started is not None:
+            self.handling_times.append(now - started)
+        self.completed_at.append(now)
+
+    def attach(self, application):
+        from telegram import Update
+        from telegram.ext import TypeHandler
+
+        application.add_handler(TypeHandler(Update, self.on_start), group=-1)
+        application.add_handler(TypeHandler(Update, self.on_complete), group=1)
+
+
+async def run_load_test(api: FakeBotAPI, script: List[Dict], drain_timeout: float) -> Dict:
+    """Run the bot application against the fake API and collect a report"""
+    import bot
+
+    application = bot.build_application(LOAD_TEST_TOKEN, api.base_url)
+    timer = HandlerTimer()
+    timer.attach(application)
+    counted_before = _counted_messages(MAIN_DB_PATH)
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=1)
+
+        started = time.perf_counter()
+        feeder = threading.Thread(target=replay, args=(api, script, started), daemon=True)
+        feeder.start()
+        while feeder.is_alive():
+            await asyncio.sleep(0.05)
+
+        # Let the bot catch up with the backlog before stopping it
+        drain_deadline = time.perf_counter() + drain_timeout
+        while time.perf_counter() < drain_deadline:
+            if (not api.pending_updates() and not api.pending_replies()
+                    and len(timer.completed_at) >= len(api.fetched_at)):
+                break
+            # Replies lost to 429s never arrive; stop once the bot goes quiet
+            if not api.pending_updates() and application.update_queue.empty() and api.idle_for() > 1.0:
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+
+        await application.updater.stop()
+        await application.stop()
+
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    counted = _counted_messages(MAIN_DB_PATH) - counted_before
+
+    allowed = set(ALLOWED_USERS)
+    expected_counted = sum(1 for item in script
+                           if item["user_id"] in allowed and not item["text"].startswith("/"))
+    commands = sum(1 for item in script if item["text"].startswith("/"))
+    fetch_delays = [api.fetched_at[u] - api.injected_at[u] for u in api.fetched_at]
+
+    # Handler throughput is measured from the first fetch to the last completed update
+    completed = len(timer.completed_at)
+    first_fetch = min(api.fetched_at.values(), default=0.0)
+    handling_window = max(timer.completed_at, default=first_fetch) - first_fetch
+    busy_time = sum(timer.handling_times)
+
+    return {
+        "updates_sent": len(script),
+        "updates_fetched": len(api.fetched_at),
+        "updates_not_fetched": len(script) - len(api.fetched_at),
+        "messages_expected": expected_counted,
+        "messages_counted": counted,
+        "messages_dropped": expected_counted - counted,
+        "commands_sent": commands,
+        "replies_received": len(api.reply_latencies),
+        "replies_missing": commands - len(api.reply_latencies),
+        "elapsed_s": round(elapsed, 3),
+        "updates_handled": completed,
+        "handling_window_s": round(handling_window, 3),
+        "throughput_updates_per_s": round(completed / handling_window, 2) if handling_window else 0.0,
+        "fetch_rate_updates_per_s": round(len(api.fetched_at) / elapsed, 2) if elapsed else 0.0,
+        "handling_time_p50_ms": round(_percentile(timer.handling_times, 50) * 1000, 2),
+        "handling_time_p95_ms": round(_percentile(timer.handling_times, 95) * 1000, 2),
+        # Sequential handling capacity: updates per second of handler busy time
+        "handler_capacity_updates_per_s": round(completed / busy_time, 2) if busy_time else 0.0,
+        "fetch_delay_p50_ms": round(_percentile(fetch_delays, 50) * 1000, 2),
+        "fetch_delay_p95_ms": round(_percentile(fetch_delays, 95) * 1000, 2),
+        "reply_latency_p50_ms": round(_percentile(api.reply_latencies, 50) * 1000, 2),
+        "reply_latency_p95_ms": round(_percentile(api.reply_latencies, 95) * 1000, 2),
+        "reply_latency_p99_ms": round(_percentile(api.reply_latencies, 99) * 1000, 2),
+        "reply_latency_max_ms": round(max(api.reply_latencies, default=0.0) * 1000, 2),
+        "api_calls": dict(api.calls),
+        "flood_errors": dict(api.flood_errors),
+        # CPU time covers the whole process, fake API server threads included
+        "cpu_user_s": round(usage_after.ru_utime - usage_before.ru_utime, 3),
+        "cpu_system_s": round(usage_after.ru_stime - usage_before.ru_stime, 3),
+        "max_rss_mb": round(usage_after.ru_maxrss / 1024, 1),
+    }
+
+
+def format_report(report: Dict) -> str:
+    """Format the load test report for display"""
+    lines = ["Load test report", "━━━━━━━━━━━━━━━"]
+    for key, value in report.items():
+        lines.append(f"{key}: {value}")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay traffic against the bot through a fake Bot API")
+    parser.add_argument("--duration", type=float, default=10.0, help="traffic duration in seconds")
+    parser.add_argument("--rate", type=float, default=20.0, help="average incoming updates per second")
+    parser.add_argument("--chats", type=int, default=3, help="number of group chats")
+    parser.add_argument("--users", type=int, default=len(ALLOWED_USERS) + 3,
+                        help="number of senders (allowed users first, then outsiders)")
+    parser.add_argument("--command-ratio", type=float, default=0.1, help="share of messages that are commands")
+    parser.add_argument("--private-ratio", type=float, default=0.2, help="share of messages sent in private chats")
+    parser.add_argument("--script", help="JSON or JSON-lines traffic script to replay instead of generated traffic")
+    parser.add_argument("--latency", type=float, default=0.0, help="base Bot API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="probability of a 429 on getChatMember/sendMessage")
+    parser.add_argument("--chat-send-limit", type=float, default=0.0,
+                        help="sendMessage calls per second allowed per chat before 429 (0 disables)")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after value sent with 429 responses")
+    parser.add_argument("--drain-timeout", type=float, default=10.0,
+                        help="seconds to wait for the backlog after traffic ends")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING", help="log level for the bot during the run")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.script:
+        script = load_script(args.script)
+    else:
+        script = build_script(args.duration, args.rate, args.chats, args.users,
+                              args.command_ratio, args.private_ratio, args.seed)
+
+    # The bot opens its databases relative to the working directory,
+    # so run it in a scratch directory to keep real statistics untouched
+    workdir = tempfile.TemporaryDirectory()
+    os.chdir(workdir.name)
+    import bot  # noqa: F401  (creates the stats handler inside workdir)
+    logging.getLogger().setLevel(args.log_level.upper())
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    api = FakeBotAPI(args.latency, args.jitter, args.error_rate, args.chat_send_limit,
+                     args.retry_after, args.seed)
+    api.start()
+    try:
+        report = asyncio.run(run_load_test(api, script, args.drain_timeout))
+    finally:
+        api.stop()
+
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
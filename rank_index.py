@@ -0,0 +1,130 @@
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+class RankIndex:
+    """Order-statistic index over message counts.
+
+    Users are stored in a Fenwick tree keyed by their message count, so
+    rank and percentile lookups take O(log n) instead of a
+    COUNT(*) scan over the table. Banned users are kept out of the tree,
+    mirroring how they are excluded from the top lists. Users with no
+    messages are left out too, so they get no place until they write.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._counts: Dict[int, int] = {}
+        self._banned: Set[int] = set()
+        self._total = 0
+        self._init_tree(capacity)
+
+    def _init_tree(self, capacity: int):
+        self._size = capacity
+        self._tree = [0] * (capacity + 1)
+
+    def _add(self, count: int, delta: int):
+        """Add delta to the bucket for the given count"""
+        i = count + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, count: int) -> int:
+        """Number of ranked users with message count <= count"""
+        i = min(count + 1, self._size)
+        result = 0
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+    def _ranked(self, user_id: int) -> bool:
+        """Whether a user currently occupies a bucket in the tree"""
+        return self._counts.get(user_id, 0) > 0 and user_id not in self._banned
+
+    def _ensure_capacity(self, count: int):
+        """Grow the tree when a count falls outside the current buckets"""
+        if count < self._size:
+            return
+        capacity = self._size
+        while count >= capacity:
+            capacity *= 2
+        self._init_tree(capacity)
+        for user_id, user_count in self._counts.items():
+            if self._ranked(user_id):
+                self._add(user_count, 1)
+
+    def load(self, rows: Iterable[Tuple[int, int, bool]]):
+        """Rebuild the index from (user_id, message_count, is_banned) rows"""
+        with self._lock:
+            self._counts = {}
+            self._banned = set()
+            self._total = 0
+            for user_id, count, is_banned in rows:
+                self._counts[user_id] = count or 0
+                if is_banned:
+                    self._banned.add(user_id)
+            capacity = 1024
+            while self._counts and max(self._counts.values()) >= capacity:
+                capacity *= 2
+            self._init_tree(capacity)
+            for user_id, count in self._counts.items():
+                if self._ranked(user_id):
+                    self._add(count, 1)
+                    self._total += 1
+
+    def increment(self, user_id: int):
+        """Register one more message for a user (ignored for banned users)"""
+        with self._lock:
+            if user_id in self._banned:
+                return
+            old_count = self._counts.get(user_id, 0)
+            new_count = old_count + 1
+            self._ensure_capacity(new_count)
+            if old_count == 0:
+                self._total += 1
+            else:
+                self._add(old_count, -1)
+            self._counts[user_id] = new_count
+            self._add(new_count, 1)
+
+    def set_banned(self, user_id: int, banned: bool = True):
+        """Exclude a user from ranking or bring them back"""
+        with self._lock:
+            # Unknown users have no row to update, same as in the database
+            if user_id not in self._counts:
+                return
+            was_ranked = self._ranked(user_id)
+            if banned:
+                self._banned.add(user_id)
+            else:
+                self._banned.discard(user_id)
+            is_ranked = self._ranked(user_id)
+            if was_ranked != is_ranked:
+                delta = 1 if is_ranked else -1
+                self._add(self._counts[user_id], delta)
+                self._total += delta
+
+    def reset(self):
+        """Zero the counts of all non-banned users, keeping banned ones intact"""
+        with self._lock:
+            for user_id in self._counts:
+                if user_id not in self._banned:
+                    self._counts[user_id] = 0
+            # Only banned users keep their counts, and they are not in the tree
+            self._init_tree(self._size)
+            self._total = 0
+
+    def rank(self, user_id: int) -> Optional[Tuple[int, int]]:
+        """Return (rank, total) for a user, or None if they are not ranked.
+
+        Rank is 1 plus the number of users with strictly more messages,
+        so users with equal counts share a place.
+        """
+        with self._lock:
+            if not self._ranked(user_id):
+                return None
+            count = self._counts[user_id]
+            higher = self._total - self._prefix(count)
+            return higher + 1, self._total
@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 
 class StatsHandler:
     def __init__(self):
-        self.main_db = Database(MAIN_DB_PATH)
+        self.main_db = Database(MAIN_DB_PATH, track_activity=True)
         self.daily_db = Database(DAILY_DB_PATH)
         self.graph_generator = GraphGenerator()
         self._setup_daily_reset()
@@ -38,20 +38,31 @@ class StatsHandler:
             logging.error(f"Error generating activity graph: {e}")
             return None
 
-    def generate_timeline_graph(self, days: int = 7) -> Optional[bytes]:
-        """Generate timeline graph for the specified period"""
+    def generate_timeline_graph(self, days: int = 7, resolution: str = "day", top_n: int = 0) -> Optional[bytes]:
+        """Generate timeline graph for the specified period, optionally per top user"""
         try:
             data = self.main_db.get_activity_timeline(days)
-            return self.graph_generator.generate_timeline_graph(data, days)
+            return self.graph_generator.generate_timeline_graph(
+                data, days, resolution, top_n, self.main_db.get_display_names
+            )
         except Exception as e:
             logging.error(f"Error generating timeline graph: {e}")
             return None
 
-    def update_stats(self, user_id: int, username: str):
+    def generate_heatmap_graph(self, days: int = 30) -> Optional[bytes]:
+        """Generate hour-of-day x weekday heatmap for the specified period"""
+        try:
+            data = self.main_db.get_activity_timeline(days)
+            return self.graph_generator.generate_heatmap_graph(data)
+        except Exception as e:
+            logging.error(f"Error generating heatmap graph: {e}")
+            return None
+
+    def update_stats(self, user_id: int, username: Optional[str], first_name: Optional[str] = None):
         """Update both main and daily statistics for a user"""
         try:
-            self.main_db.update_user_stats(user_id, username)
-            self.daily_db.update_user_stats(user_id, username)
+            self.main_db.update_user_stats(user_id, username, first_name)
+            self.daily_db.update_user_stats(user_id, username, first_name)
         except Exception as e:
             logging.error(f"Error updating stats: {e}")
 
@@ -70,6 +81,9 @@ class StatsHandler:
                 }
                 if daily_stats:
                     stats["daily_messages"] = daily_stats["message_count"]
+                stats["rank"] = self.main_db.get_user_rank(user_id)
+                if include_daily:
+                    stats["daily_rank"] = self.daily_db.get_user_rank(user_id)
                 return stats
             return {
                 "username": "Unknown",
@@ -6,11 +6,21 @@ def format_user_stats(stats: dict) -> str:
     if not stats:
         return "Статистика не найдена."
 
-    return (f"📊 Статистика пользователя @{stats['username']}\n"
-            f"━━━━━━━━━━━━━━━\n"
-            f"📝 Всего сообщений: {stats['message_count']}\n"
-            f"🕒 Последнее сообщение: {stats['last_message']}\n"
-            f"━━━━━━━━━━━━━━━")
+    result = (f"📊 Статистика пользователя @{stats['username']}\n"
+              f"━━━━━━━━━━━━━━━\n"
+              f"📝 Всего сообщений: {stats['message_count']}\n"
+              f"🕒 Последнее сообщение: {stats['last_message']}\n")
+
+    rank = stats.get('rank')
+    if rank:
+        result += f"🏆 Место: #{rank['rank']} из {rank['total']} (топ {rank['percentile']}%)\n"
+
+    daily_rank = stats.get('daily_rank')
+    if daily_rank:
+        result += f"📅 Место за сегодня: #{daily_rank['rank']} из {daily_rank['total']} (топ {daily_rank['percentile']}%)\n"
+
+    result += "━━━━━━━━━━━━━━━"
+    return result
 
 def format_top_users(stats: Dict[str, List], limit: int = 10) -> str:
     """Format top users statistics for display"""